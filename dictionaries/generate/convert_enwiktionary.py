@@ -1,8 +1,13 @@
 import sys
 import re
+import functools
 import html
-import itertools
+import heapq
 import logging
+import mmap
+import multiprocessing
+import os
+import tempfile
 
 # Configure logging
 logging.basicConfig(
@@ -17,38 +22,69 @@ logger = logging.getLogger(__name__)
 # This script processes Wiktionary data to extract and clean word pairs in two languages,
 # generates phrase combinations, and writes them to an output file (dictionary).
 
-
-def wiki_to_text(wiki_text):
-    """Convert wiki markup to plain display text."""
-    logger.debug("Converting wiki markup to text: %s", wiki_text)
-
-    def replace_link(match):
-        # Extract text from wiki links, taking the display text after '|' if present
-        inner = match.group(1)
-        if "|" in inner:
-            return inner.split("|")[-1]  # Use text after last '|' as display text
-        return inner  # Use entire inner text if no '|'
-
-    # Pattern matches [[link]] or [[link|text]] without nested brackets
-    pattern = r"\[\[([^\]\[]*)\]\]"
-    return re.sub(pattern, replace_link, wiki_text)
-
-
+# Pre-compiled regex patterns (avoids the per-call pattern cache lookup on the hot path)
+# Single alternation covering [[...]], ''...'' and "..." so clean_phrase strips
+# all three markups in one scan instead of three
+_CLEAN_RE = re.compile(r"\[\[(.*?)\]\]|''(.*?)''|\"(.*?)\"")
+_PAREN_FULL_RE = re.compile(r"\([^()]*\)")  # standalone parenthetical like (word)
+_BRACKET_CHAR_RE = re.compile(r"[\[\](){}]")  # any bracket character
+
+# Byte markers delimiting a translation block in the raw dump
+_BLOCK_START = b"{{trans-top|"
+_BLOCK_END = b"{{trans-bottom}}"
+
+
+def _resolve_links(text):
+    """Convert [[link]] / [[link|text]] wiki markup to plain display text."""
+    parts = []
+    last = 0
+    start = text.find("[[")
+    while start != -1:
+        end = text.find("]]", start + 2)
+        if end == -1:
+            break
+        inner = text[start + 2 : end]
+        parts.append(text[last:start])
+        # Use the text after the last '|' as the display text
+        parts.append(inner.rsplit("|", 1)[-1])
+        last = end + 2
+        start = text.find("[[", last)
+    parts.append(text[last:])
+    return "".join(parts)
+
+
+@functools.lru_cache(maxsize=200_000)
 def extract_words(translation_part):
-    """Extract words from {{t...}} templates, handling [[...]] via wiki_to_text."""
+    """Extract words from {{t...}} templates, resolving [[...]] links inline.
+
+    A single str.find-driven scan replaces the old template regex plus the
+    per-match link regex, so each line is walked once without the regex engine.
+    """
     logger.debug("Extracting words from translation part: %s", translation_part)
-    # Match templates like {{t|...}}, {{t+|...}}, or {{t-|...}}
-    pattern = r"\{\{t[+-]?\|(.*?)\}\}"
-    matches = re.findall(pattern, translation_part)
     words = []
-    for match in matches:
-        cleaned_match = wiki_to_text(match)
-        params = cleaned_match.split("|")
+    length = len(translation_part)
+    i = translation_part.find("{{t")
+    while i != -1:
+        # Validate the template head: {{t|, {{t+| or {{t-|
+        j = i + 3
+        if j < length and translation_part[j] in "+-":
+            j += 1
+        if translation_part[j : j + 1] != "|":
+            i = translation_part.find("{{t", i + 1)
+            continue
+        end = translation_part.find("}}", j + 1)
+        if end == -1:
+            break
+        content = translation_part[j + 1 : end]
+        if "[[" in content:
+            content = _resolve_links(content)
+        params = content.split("|")
         # Assume second parameter is the word (after language code)
         if len(params) >= 2:
             word = params[1].strip()
             if word:  # Only add non-empty words
                 words.append(word)
+        i = translation_part.find("{{t", end + 2)
     logger.debug("Extracted words: %s", words)
     return words
 
@@ -56,42 +92,55 @@ def extract_words(translation_part):
 def remove_unmatched_brackets(phrase):
     """Remove unmatched brackets, parentheses, or braces."""
     pairs = {"]": "[", ")": "(", "}": "{"}
-    opening = set(["[", "(", "{"])
-    closing = set(["]", ")", "}"])
+    opening = "([{"
 
+    # Visit only the bracket characters; the regex scan skips everything else
+    # at C speed (and most phrases contain no brackets at all)
     stack = []
-    unmatched = set()
-
-    # Track positions of brackets to identify unmatched ones
-    for i, char in enumerate(phrase):
+    unmatched = []
+    for match in _BRACKET_CHAR_RE.finditer(phrase):
+        char = match.group()
         if char in opening:
-            stack.append((char, i))
-        elif char in closing:
-            if stack and pairs[char] == stack[-1][0]:
-                stack.pop()  # Matched pair found
-            else:
-                unmatched.add(i)  # Unmatched closing bracket
+            stack.append((char, match.start()))
+        elif stack and pairs[char] == stack[-1][0]:
+            stack.pop()  # Matched pair found
+        else:
+            unmatched.append(match.start())  # Unmatched closing bracket
 
-    # Add positions of unmatched opening brackets
-    unmatched.update(i for _, i in stack)
-    # Reconstruct phrase excluding unmatched bracket positions
-    result = "".join(char for i, char in enumerate(phrase) if i not in unmatched)
-    return result
+    if not stack and not unmatched:
+        return phrase  # Everything matched (or no brackets present)
 
+    # Unmatched opening brackets left on the stack go too; rebuild the phrase
+    # from the contiguous runs between the dropped positions
+    unmatched.extend(i for _, i in stack)
+    unmatched.sort()
+    parts = []
+    last = 0
+    for i in unmatched:
+        parts.append(phrase[last:i])
+        last = i + 1
+    parts.append(phrase[last:])
+    return "".join(parts)
 
+
+@functools.lru_cache(maxsize=200_000)
 def clean_phrase(phrase):
     """Clean a phrase by decoding HTML entities, removing brackets/quotes, and normalizing slashes and whitespace."""
     logger.debug("Cleaning phrase: %s", phrase)
-    phrase = html.unescape(phrase)  # Decode HTML entities (e.g., &amp; to &)
-    phrase = re.sub(
-        r"\[\[(.*?)\]\]", r"\1", phrase
-    )  # Remove wiki link brackets, keep inner text
-    phrase = re.sub(r"''(.*?)''", r"\1", phrase)  # Remove double single quotes
-    phrase = re.sub(r'"(.*?)"', r"\1", phrase)  # Remove double quotes
+    if "&" in phrase:  # Decode HTML entities (e.g., &amp; to &); without an
+        phrase = html.unescape(phrase)  # ampersand there is nothing to decode
+    # Remove wiki link brackets, double single quotes, and double quotes,
+    # keeping the inner text, in a single pass over the string
+    phrase = _CLEAN_RE.sub(
+        lambda m: m.group(1) if m.group(1) is not None
+        else m.group(2) if m.group(2) is not None
+        else m.group(3),
+        phrase,
+    )
     phrase = remove_unmatched_brackets(phrase)  # Remove any unmatched brackets
-    phrase = phrase.replace("/", " / ")  # Normalize slashes for alternative handling
-    phrase = re.sub(r"\s+", " ", phrase)  # Normalize whitespace
-    cleaned = phrase.strip()  # Remove leading/trailing whitespace
+    if "/" in phrase:  # Normalize slashes for alternative handling; most
+        phrase = phrase.replace("/", " / ")  # phrases have none and skip the copy
+    cleaned = " ".join(phrase.split())  # Collapse whitespace runs and strip in one go
     logger.debug("Cleaned phrase: %s", cleaned)
     return cleaned
 
@@ -104,8 +153,19 @@ def generate_combinations(phrase):
     if not phrase.strip():
         return []
 
+    # Fast path: most phrases contain no parenthetical or slash alternatives
+    # at all and normalize to exactly one combination
+    if "(" not in phrase and "/" not in phrase:
+        normalized = " ".join(phrase.split())
+        return [normalized] if normalized else []
+
     # Tokenize the phrase into words and parenthetical expressions
     def tokenize(phrase):
+        # Without parentheses the character loop degenerates to a plain
+        # whitespace split, which runs at C speed
+        if "(" not in phrase and ")" not in phrase:
+            return phrase.split()
+
         tokens = []
         current_token = []
         level = 0
@@ -131,30 +191,53 @@ def generate_combinations(phrase):
 
     def is_parenthetical(token):
         # Check if token is a standalone parenthetical like (word)
-        return bool(re.fullmatch(r"\([^()]*\)", token))
+        return bool(_PAREN_FULL_RE.fullmatch(token))
 
     def is_attached_parenthetical(token):
         # Check if token has attached parenthetical like word(suffix) or (prefix)word
         return "(" in token and ")" in token and not is_parenthetical(token)
 
     def process_attached_parenthetical(token):
-        # Process tokens like word(suffix) recursively
-        results = []
-        match = re.match(r"^([^()]*?)\(([^()]*?)\)(.*)$", token)
-        if not match:
-            return [token]  # Base case: no parenthetical
-
-        prefix, content, suffix = match.groups()
-        # Include the parenthetical content
-        results.extend(process_attached_parenthetical(prefix + content + suffix))
-        # Exclude the parenthetical content
-        next_token = prefix + suffix
-        if next_token and next_token != token:
-            results.extend(process_attached_parenthetical(next_token))
-        elif next_token:
-            results.append(next_token)
-
-        return list(dict.fromkeys(results))  # Remove duplicates
+        # Locate the innermost (...) groups with str.find — no regex engine
+        # involved — then enumerate all include/exclude choices for them
+        spans = []
+        i = token.find("(")
+        while i != -1:
+            j = token.find(")", i + 1)
+            if j == -1:
+                break
+            # Step to the last "(" before the ")" so the pair is innermost
+            k = token.rfind("(", i + 1, j)
+            if k != -1:
+                i = k
+            spans.append((i, j))
+            i = token.find("(", j + 1)
+        if not spans:
+            return [token]  # No parenthetical
+
+        # Literal segments between (and around) the parenthetical groups,
+        # and the groups' contents
+        literals = []
+        last_end = 0
+        for start, end in spans:
+            literals.append(token[last_end:start])
+            last_end = end + 1
+        literals.append(token[last_end:])
+        contents = [token[start + 1 : end] for start, end in spans]
+
+        # Each bit of the mask decides whether to keep that group's content
+        results = set()
+        for mask in range(1 << len(spans)):
+            parts = []
+            for i, literal in enumerate(literals[:-1]):
+                parts.append(literal)
+                if mask >> i & 1:
+                    parts.append(contents[i])
+            parts.append(literals[-1])
+            candidate = "".join(parts)
+            if candidate:
+                results.add(candidate)
+        return list(results)
 
     def process_standalone_group(group):
         # Generate combinations for standalone parentheticals like (prefix) (suffix)
@@ -169,8 +252,20 @@ def generate_combinations(phrase):
             c for c in combinations if c or not combinations == [""]
         ]  # Handle empty cases
 
-    def normalize_space(s):
-        return " ".join(s.split())
+    def expand_segments(segments):
+        # Expand segment alternatives left to right, deduplicating after each
+        # step so duplicates collapse immediately instead of materializing the
+        # full Cartesian product. Working on word tuples keeps everything
+        # normalized by construction — no joining and re-splitting between
+        # stages
+        current = {()}
+        for segment in segments:
+            current = {
+                partial + tuple(alternative.split())
+                for partial in current
+                for alternative in segment
+            }
+        return current
 
     # Tokenize the phrase
     tokens = tokenize(phrase)
@@ -193,22 +288,19 @@ def generate_combinations(phrase):
             segments.append([tokens[i]])  # Regular word
             i += 1
 
-    # Generate all combinations of the segments
-    intermediate_phrases = [
-        " ".join(combo).strip() for combo in itertools.product(*segments)
-    ]
-    intermediate_phrases = [
-        normalize_space(p) for p in intermediate_phrases if p.strip()
-    ]
-
-    # Handle slashes for alternatives
+    # Handle slashes for alternatives; each intermediate is already a
+    # normalized tuple of words, so the slash grouping runs on it directly
     final_combinations = set()
-    for intermediate in intermediate_phrases:
-        words = re.split(r"\s+", intermediate.strip())
-        segments = []
+    for words in expand_segments(segments):
+        if not words:
+            continue
+        if "/" not in words:
+            final_combinations.add(" ".join(words))
+            continue
+
+        slash_segments = []
         current_alternatives = []
         i = 0
-
         while i < len(words):
             if i + 1 < len(words) and words[i] == "/":
                 i += 1
@@ -218,27 +310,139 @@ def generate_combinations(phrase):
                 i += 1
                 continue
             if current_alternatives:
-                segments.append(current_alternatives)
+                slash_segments.append(current_alternatives)
                 current_alternatives = []
             if i + 1 < len(words) and words[i + 1] == "/":
                 current_alternatives.append(words[i])
                 i += 2
                 continue
-            segments.append([words[i]])
+            slash_segments.append([words[i]])
             i += 1
 
         if current_alternatives:
-            segments.append(current_alternatives)
+            slash_segments.append(current_alternatives)
 
         # Generate combinations for this intermediate phrase
-        for combo in itertools.product(*segments):
-            final_combinations.add(normalize_space(" ".join(combo)))
+        final_combinations.update(
+            " ".join(combo) for combo in expand_segments(slash_segments) if combo
+        )
 
     # Finalize the combinations by sorting and removing duplicates
     result = sorted(list(final_combinations))
     return result
 
 
+@functools.lru_cache(maxsize=200_000)
+def generate_combinations_cached(phrase):
+    """Cached generate_combinations, returning a tuple so results can be shared.
+
+    Wiktionary entries repeat common phrases across thousands of blocks, so
+    the hit rate on the hot path is high.
+    """
+    return tuple(generate_combinations(phrase))
+
+
+# Number of cleaned pairs buffered in memory before spilling a sorted chunk to disk
+_CHUNK_SIZE = 1_000_000
+# Output bytes accumulated before each write, so syscall cost is amortized
+_WRITE_BUFFER_SIZE = 1 << 20
+
+
+def _parse_block(block, lang1, lang2):
+    """Yield (lang1, lang2) word pairs from one decoded translation block."""
+    lang1_words = set()
+    lang2_words = set()
+    for line in block.splitlines():
+        cleaned_line = line.strip().lstrip("* :")
+        if ":" in cleaned_line:
+            language_part, translation_part = cleaned_line.split(":", 1)
+            language = language_part.strip()
+            if language == lang1:
+                words = extract_words(translation_part)
+                lang1_words.update(words)
+                logger.debug("Found %s words: %s", lang1, words)
+            elif language == lang2:
+                words = extract_words(translation_part)
+                lang2_words.update(words)
+                logger.debug("Found %s words: %s", lang2, words)
+    # Pair each word from lang1 with each word from lang2
+    for word1 in lang1_words:
+        for word2 in lang2_words:
+            yield (word1, word2)
+
+
+def _iter_word_pairs(input_file, lang1, lang2):
+    """Stream raw word pairs from the input file's translation blocks.
+
+    The input is scanned as a memory map: translation blocks are located on
+    the raw bytes, so the lines outside blocks (the overwhelming majority of
+    the dump) never reach Python at all. Pairs are yielded as they are found
+    instead of being collected into a list first, and each distinct pair is
+    yielded only once: common translations recur across many blocks, and
+    dropping the repeats here skips their whole downstream cleaning cost.
+    """
+    block_count = 0
+    seen = set()
+    with open(input_file, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            # Jump from block to block with find(); everything in between is
+            # skipped at C speed without ever being decoded
+            pos = 0
+            while True:
+                start = mm.find(_BLOCK_START, pos)
+                if start < 0:
+                    break
+                end = mm.find(_BLOCK_END, start)
+                if end < 0:
+                    break  # Unterminated block, same as the old state machine
+                block_count += 1
+                if block_count % 100000 == 0:
+                    logger.info("Processed %d translation blocks", block_count)
+                block = mm[start:end].decode("utf-8")
+                for pair in _parse_block(block, lang1, lang2):
+                    if pair not in seen:
+                        seen.add(pair)
+                        yield pair
+                pos = end + len(_BLOCK_END)
+    logger.info("Finished reading file: %d translation blocks processed", block_count)
+
+
+def _clean_pair(pair):
+    """Clean one raw (original, translation) pair and expand its combinations.
+
+    Returns decorated (original, word_count, char_count, translation) tuples so
+    that sorting and merging run on native tuple comparison without a key
+    callback; the translation counts are computed once per pair, not per
+    combination.
+    """
+    original, translation = pair
+    cleaned_translation = clean_phrase(translation)
+    word_count = cleaned_translation.count(" ") + 1 if cleaned_translation else 0
+    char_count = len(cleaned_translation)
+    return [
+        (comb, word_count, char_count, cleaned_translation)
+        for comb in generate_combinations_cached(clean_phrase(original))
+    ]
+
+
+def _write_chunk(pairs, chunk_dir):
+    """Sort and deduplicate a buffer of decorated pairs and spill it to a chunk file."""
+    fd, path = tempfile.mkstemp(dir=chunk_dir, suffix=".chunk")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for original, _, _, translation in sorted(set(pairs)):
+            f.write(f"{original}\t{translation}\n")
+    return path
+
+
+def _read_chunk(path):
+    """Yield decorated tuples back from a sorted chunk file."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            original, translation = line.rstrip("\n").split("\t", 1)
+            word_count = translation.count(" ") + 1 if translation else 0
+            yield (original, word_count, len(translation), translation)
+
+
 def process_file(lang1, lang2, input_file, output_file):
     """Process the input file to extract, clean, and sort dictionary entries."""
     logger.info(
@@ -249,94 +453,78 @@ def process_file(lang1, lang2, input_file, output_file):
         output_file,
     )
 
-    # Read the input file line by line
-    word_pairs = []
-    try:
-        with open(input_file, "r", encoding="utf-8") as file:
-            in_block = False
-            lang1_words = set()
-            lang2_words = set()
-            line_count = 0
-
-            # Extract word pairs from translation blocks
-            for line in file:
-                line_count += 1
-                if line_count % 1000000 == 0:
-                    logger.info("Processed %d lines", line_count)
-
-                line = line.strip()
-                if line.startswith("{{trans-top|"):
-                    in_block = True
-                    lang1_words = set()
-                    lang2_words = set()
-                    logger.debug("Entered translation block")
-                    continue
-                if line.startswith("{{trans-bottom}}"):
-                    if in_block and lang1_words and lang2_words:
-                        # Pair each word from lang1 with each word from lang2
-                        for word1 in lang1_words:
-                            for word2 in lang2_words:
-                                word_pairs.append((word1, word2))
-                        logger.debug(
-                            "Extracted %d pairs from block",
-                            len(lang1_words) * len(lang2_words),
+    # Stream raw pairs from the extraction generator straight into the worker
+    # pool and spill sorted chunks to disk, so neither the raw pairs nor the
+    # cleaned pairs are ever held in memory in full
+    with tempfile.TemporaryDirectory() as chunk_dir:
+        pair_count = 0
+        cleaned_count = 0
+        buffer = []
+        chunk_paths = []
+        try:
+            word_pairs = _iter_word_pairs(input_file, lang1, lang2)
+            # The per-pair cleaning is embarrassingly parallel and CPU-bound,
+            # so fan it out across all cores
+            with multiprocessing.Pool() as pool:
+                for cleaned in pool.imap_unordered(
+                    _clean_pair, word_pairs, chunksize=1024
+                ):
+                    pair_count += 1
+                    # Intern the strings: the same originals and translations
+                    # recur constantly (and arrive from the workers as fresh
+                    # unpickled objects), so sharing one copy shrinks the
+                    # buffer and makes the dedup set's equality checks cheap
+                    buffer.extend(
+                        (
+                            sys.intern(original),
+                            word_count,
+                            char_count,
+                            sys.intern(translation),
                         )
-                    in_block = False
-                    lang1_words = set()
-                    lang2_words = set()
-                    continue
-                if in_block:
-                    cleaned_line = line.lstrip("* :")
-                    if ":" in cleaned_line:
-                        language_part, translation_part = cleaned_line.split(":", 1)
-                        language = language_part.strip()
-                        if language == lang1:
-                            words = extract_words(translation_part)
-                            lang1_words.update(words)
-                            logger.debug("Found %s words: %s", lang1, words)
-                        elif language == lang2:
-                            words = extract_words(translation_part)
-                            lang2_words.update(words)
-                            logger.debug("Found %s words: %s", lang2, words)
-        logger.info("Finished reading file: %d lines processed", line_count)
-    except FileNotFoundError:
-        logger.error("File not found: %s", input_file)
-        sys.exit(1)
-    except Exception as e:
-        logger.error("Error extracting from file: %s", e)
-        sys.exit(1)
+                        for original, word_count, char_count, translation in cleaned
+                    )
+                    cleaned_count += len(cleaned)
+                    if len(buffer) >= _CHUNK_SIZE:
+                        chunk_paths.append(_write_chunk(buffer, chunk_dir))
+                        buffer = []
+        except FileNotFoundError:
+            logger.error("File not found: %s", input_file)
+            sys.exit(1)
+        except Exception as e:
+            logger.error("Error extracting from file: %s", e)
+            sys.exit(1)
+        if buffer:
+            chunk_paths.append(_write_chunk(buffer, chunk_dir))
+        logger.info("Extracted %d word pairs", pair_count)
+        logger.info(
+            "Generated %d cleaned pairs in %d chunks", cleaned_count, len(chunk_paths)
+        )
 
-    logger.info("Extracted %d word pairs", len(word_pairs))
-
-    # Clean phrases and generate combinations for original phrases
-    cleaned_pairs = []
-    for original, translation in word_pairs:
-        cleaned_original = clean_phrase(original)
-        cleaned_translation = clean_phrase(translation)
-        original_combinations = generate_combinations(cleaned_original)
-        for comb in original_combinations:
-            cleaned_pairs.append((comb, cleaned_translation))
-    logger.info("Generated %d cleaned pairs", len(cleaned_pairs))
-
-    # Sort the pairs and remove duplicates
-    def sort_key(pair):
-        original, translation = pair
-        word_count = len(translation.split())
-        char_count = len(translation)
-        return (original, word_count, char_count, translation)
-
-    sorted_pairs = sorted(set(cleaned_pairs), key=sort_key)
-    logger.info("After sorting and deduplication: %d pairs", len(sorted_pairs))
-
-    # Write the sorted pairs to the output file
-    try:
-        with open(output_file, "w", encoding="utf-8") as f:
-            for original, translation in sorted_pairs:
-                f.write(f"{original}\t{translation}\n")
-        logger.info("Successfully wrote output to %s", output_file)
-    except Exception as e:
-        logger.error("Error writing to output file: %s", e)
-        sys.exit(1)
+        # Merge the sorted chunks, dropping duplicates, and write the output
+        # in megabyte batches instead of one formatted write per record
+        try:
+            with open(output_file, "wb") as f:
+                written = 0
+                previous = None
+                out_buffer = bytearray()
+                merged = heapq.merge(*(_read_chunk(path) for path in chunk_paths))
+                for entry in merged:
+                    if entry != previous:
+                        out_buffer += entry[0].encode("utf-8")
+                        out_buffer += b"\t"
+                        out_buffer += entry[3].encode("utf-8")
+                        out_buffer += b"\n"
+                        previous = entry
+                        written += 1
+                        if len(out_buffer) >= _WRITE_BUFFER_SIZE:
+                            f.write(out_buffer)
+                            out_buffer.clear()
+                f.write(out_buffer)
+            logger.info("After sorting and deduplication: %d pairs", written)
+            logger.info("Successfully wrote output to %s", output_file)
+        except Exception as e:
+            logger.error("Error writing to output file: %s", e)
+            sys.exit(1)
 
 
 def run_tests():
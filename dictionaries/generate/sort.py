@@ -2,33 +2,33 @@ import sys
 
 
 def process_file(input_file):
-    # Read all lines from the input file
-    with open(input_file, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    # Filter valid lines and print invalid lines to stderr
+    # Stream the input line by line, keeping valid lines and printing invalid
+    # lines to stderr; this avoids materializing the raw file contents
+    # alongside the stripped lines
     valid_lines = []
-    for line in lines:
-        stripped_line = line.strip()
-        parts = stripped_line.split("\t")
-        if len(parts) == 2:
-            valid_lines.append(stripped_line)
-        else:
-            print(stripped_line, file=sys.stderr)
-
-    # Define the key function for sorting
-    def key_func(line):
-        original, translation = line.strip().split("\t")
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line in f:
+            stripped_line = line.strip()
+            parts = stripped_line.split("\t")
+            if len(parts) == 2:
+                valid_lines.append(stripped_line)
+            else:
+                print(stripped_line, file=sys.stderr)
+
+    # Decorate each line with its sort key once, so sorting compares plain
+    # tuples instead of re-splitting the line on every comparison; the index
+    # keeps the original order for key ties, like the stable keyed sort did
+    decorated = []
+    for index, line in enumerate(valid_lines):
+        original, translation = line.split("\t")
         word_count = len(translation.split())
         char_count = len(translation)
-        return (original, word_count, char_count)
-
-    # Sort the valid lines using the key function
-    sorted_lines = sorted(valid_lines, key=key_func)
+        decorated.append((original, word_count, char_count, index, line))
+    decorated.sort()
 
     # Remove duplicate lines while preserving sorted order and print unique lines
     prev_line = None
-    for line in sorted_lines:
+    for *_, line in decorated:
         if line != prev_line:
             print(line)
             prev_line = line